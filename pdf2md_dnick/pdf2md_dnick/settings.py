@@ -114,3 +114,21 @@ STATIC_URL = 'static/'
 DATA_UPLOAD_MAX_MEMORY_SIZE = 30 * 1024 * 1024
 FILE_UPLOAD_MAX_MEMORY_SIZE = 30 * 1024 * 1024
 PDF_IMAGE_OUTPUT_DIR = BASE_DIR / "exported_images"
+
+# Conversion results are cached per (PDF hash, model); each entry can be several MB.
+# Background job state lives in "jobs"; entries are tiny, but one must never be
+# culled while its client is still polling.
+# Both are per-process: when serving with several processes (gunicorn, uwsgi),
+# point them at a shared backend such as Redis or Memcached.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 100},
+    },
+    "jobs": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "pdf2md-jobs",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+PDF_RESULT_CACHE_TIMEOUT = 24 * 60 * 60
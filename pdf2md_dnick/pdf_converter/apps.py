@@ -1,5 +1,90 @@
+import logging
+import os
+import sys
+from pathlib import Path
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+
+# Executables that serve the app; any other command (migrate, shell, tests, scripts) is not prewarmed
+SERVER_PROGRAMS = {"gunicorn", "uvicorn", "uwsgi", "daphne"}
+
+
+def _is_serving() -> bool:
+    """True in the process that answers requests, not in migrate/shell or the autoreloader parent."""
+    argv = getattr(sys, "argv", None) or [""]
+    if "runserver" in argv:
+        # With the autoreloader, only the child process (RUN_MAIN=true) serves
+        return "--noreload" in argv or os.environ.get("RUN_MAIN") == "true"
+    return Path(argv[0]).name in SERVER_PROGRAMS
+
+
+# Pre-forking servers, which normally run several worker processes
+MULTIPROCESS_SERVER_PROGRAMS = {"gunicorn", "uwsgi"}
+
+# Cache backends whose entries only the storing process can see
+PROCESS_LOCAL_CACHE_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def _is_multiprocess_server() -> bool:
+    argv = getattr(sys, "argv", None) or [""]
+    if Path(argv[0]).name in MULTIPROCESS_SERVER_PROGRAMS:
+        return True
+    return any(arg == "--workers" or arg.startswith("--workers=") for arg in argv[1:])
+
+
+def _check_shared_cache() -> None:
+    """
+    Refuse to serve with several processes and a per-process cache.
+
+    A job's state and result are stored by the process that ran it, while
+    the client's polls can reach any process, which would then answer 404.
+    """
+    from .jobs import JOBS_CACHE
+
+    for alias in dict.fromkeys(("default", JOBS_CACHE)):
+        backend = settings.CACHES[alias]["BACKEND"]
+        if backend in PROCESS_LOCAL_CACHE_BACKENDS:
+            raise ImproperlyConfigured(
+                f"CACHES[{alias!r}] uses {backend}, which each server process keeps to itself. "
+                "Conversion jobs are polled across processes: configure a shared cache "
+                "such as Redis, Memcached or the database cache."
+            )
 
 
 class PdfConverterConfig(AppConfig):
     name = 'pdf_converter'
+
+    def ready(self):
+        if not _is_serving():
+            return
+
+        if _is_multiprocess_server():
+            _check_shared_cache()
+
+        from .views import remove_orphaned_uploads
+
+        removed = remove_orphaned_uploads()
+        if removed:
+            logger.info("Removed %d orphaned upload(s)", removed)
+
+        # Load the configured model at start-up so the first conversion
+        # does not pay for loading weights / language data
+        key = os.getenv("PREWARM_MODEL")
+        if not key:
+            return
+
+        from . import ocr_models  # noqa: F401  (registers the models)
+        from .ocr_registry import create_model
+
+        try:
+            create_model(key).warmup()
+        except Exception:
+            logger.exception("Could not prewarm model %r", key)
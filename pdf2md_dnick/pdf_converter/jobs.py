@@ -0,0 +1,117 @@
+"""
+Background jobs for long-running conversions.
+
+OCR on a multi-page PDF can take minutes, which would otherwise block
+the request thread and run into server timeouts. Work is submitted to
+an in-process thread pool and the client polls for the result by job id.
+
+Usage:
+    from . import jobs
+
+    job_id = jobs.submit(lambda: {"markdown": ...})
+    jobs.status(job_id)  # {"state": "pending" | "running" | "done" | "failed", ...}
+
+Job state is kept in the "jobs" cache (the default cache if there is no
+such alias). With several server processes it must be a shared backend
+(Redis, Memcached, database), or polls reaching another process would
+not find the job; apps.py refuses to start otherwise.
+
+At most MAX_PENDING_JOBS jobs are queued or running per process; submit()
+raises QueueFull beyond that, so the caller can turn clients away instead
+of piling up uploads.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+logger = logging.getLogger(__name__)
+
+# Conversions running at the same time. Each model already parallelizes
+# across pages, so a couple of jobs is enough to keep the CPU busy.
+JOB_WORKERS = int(os.getenv("OCR_JOB_WORKERS") or 2)
+
+# Jobs queued or running at the same time; submit() refuses more
+MAX_PENDING_JOBS = int(os.getenv("OCR_MAX_PENDING_JOBS") or JOB_WORKERS * 4)
+
+# How long a finished job's result can still be fetched, in seconds
+JOB_TTL = 60 * 60
+
+# Cache alias holding job state
+JOBS_CACHE = "jobs" if "jobs" in settings.CACHES else DEFAULT_CACHE_ALIAS
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="pdf2md-job")
+
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    """Raised by submit() when MAX_PENDING_JOBS jobs are already queued or running."""
+
+
+def _cache_key(job_id: str) -> str:
+    return f"pdf2md:job:{job_id}"
+
+
+def _set_state(job_id: str, state: Dict) -> None:
+    caches[JOBS_CACHE].set(_cache_key(job_id), state, timeout=JOB_TTL)
+
+
+def _run(job_id: str, fn: Callable[[], Dict]) -> None:
+    global _pending
+    try:
+        _set_state(job_id, {"state": "running"})
+        try:
+            result = fn()
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            _set_state(job_id, {"state": "failed", "error": str(e)})
+        else:
+            _set_state(job_id, {"state": "done", **result})
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+def submit(fn: Callable[[], Dict]) -> str:
+    """
+    Run fn in the background.
+
+    Args:
+        fn: Callable returning the job's result as a dict. If it raises,
+            the job fails with str(exception) as its error message.
+
+    Returns:
+        The job id to pass to status().
+
+    Raises:
+        QueueFull: MAX_PENDING_JOBS jobs are already queued or running.
+    """
+    global _pending
+    with _pending_lock:
+        if _pending >= MAX_PENDING_JOBS:
+            raise QueueFull
+        _pending += 1
+
+    job_id = uuid.uuid4().hex
+    try:
+        _set_state(job_id, {"state": "pending"})
+        _executor.submit(_run, job_id, fn)
+    except BaseException:
+        with _pending_lock:
+            _pending -= 1
+        raise
+    return job_id
+
+
+def status(job_id: str) -> Optional[Dict]:
+    """Return the job's state dict, or None if the job is unknown or expired."""
+    return caches[JOBS_CACHE].get(_cache_key(job_id))
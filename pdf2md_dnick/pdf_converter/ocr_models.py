@@ -6,21 +6,28 @@ To add a new model:
     1. Create a class inheriting from BasePDFModel
     2. Implement predict()
     3. Use @register_model("key", "Display Label") decorator
-    4. Wrap in try/except if the model has optional dependencies
+    4. Guard it with importlib.util.find_spec() if the model has optional
+       dependencies, and import them inside the class, not at module level
 
 Models are conditionally registered based on available dependencies,
 allowing Docker images to include only specific models.
 """
 
 from __future__ import annotations
+import importlib.util
 import os
+import queue
 import tempfile
+import threading
 from abc import ABC, abstractmethod
-from pathlib import Path
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
 
 from .ocr_registry import register_model
-from .pdf_pages import pdf_bytes_to_page_images
+from .pdf_pages import iter_page_arrays, scratch_dir
 
 
 class BasePDFModel(ABC):
@@ -42,41 +49,196 @@ class BasePDFModel(ABC):
         """
         raise NotImplementedError
 
+    def predict_path(self, pdf_path: str) -> str:
+        """
+        Same as predict(), for a PDF that is already on disk.
+
+        Models that can read the file themselves should override this
+        so the whole PDF never has to be loaded into memory.
+
+        Args:
+            pdf_path: Path to the PDF file.
+
+        Returns:
+            Extracted text or markdown string.
+        """
+        with open(pdf_path, "rb") as f:
+            return self.predict(f.read())
+
+    def warmup(self) -> None:
+        """
+        Load anything that would otherwise be loaded lazily by the first predict().
+
+        Called once at start-up for the model named by PREWARM_MODEL.
+        Models that load everything in __init__ need not override it.
+        """
+
+
+def _same_shape_batches(pages: Iterable[np.ndarray], size: int) -> Iterator[list[np.ndarray]]:
+    """
+    Group consecutive pages of identical height and width into lists of at most `size`, consuming lazily.
+
+    A page whose size differs from the previous one (e.g. a landscape page
+    in a portrait document) starts a new batch.
+    """
+    batch: list[np.ndarray] = []
+    for page in pages:
+        if batch and (len(batch) == size or page.shape[:2] != batch[0].shape[:2]):
+            yield batch
+            batch = []
+        batch.append(page)
+    if batch:
+        yield batch
+
 
 # =============================================================================
 # EasyOCR Model
 # =============================================================================
-try:
-    import easyocr as _easyocr_module
+# Heavy libraries (torch, marker) are only imported when a model is first
+# created, so the Django process starts without loading them.
+if importlib.util.find_spec("easyocr") is not None:
+
+    _easyocr_readers: dict[tuple[str, bool, str], "easyocr.Reader"] = {}
+    # Held while a Reader loads, so concurrent jobs wait for it instead of loading a second copy
+    _easyocr_readers_lock = threading.Lock()
+
+    def _get_easyocr_reader(lang: str, gpu: bool, detector: str):
+        """Share one Reader per (lang, gpu, detector) across model instances; loading it takes seconds."""
+        import easyocr
+
+        key = (lang, gpu, detector)
+        with _easyocr_readers_lock:
+            if key not in _easyocr_readers:
+                # quantize only applies on CPU, where it switches the models to dynamic int8
+                _easyocr_readers[key] = easyocr.Reader(
+                    [lang],
+                    gpu=gpu,
+                    detect_network=detector,
+                    quantize=True,
+                    cudnn_benchmark=True,
+                )
+            return _easyocr_readers[key]
 
     @register_model("easyocr", "EasyOCR")
     class EasyOCRModel(BasePDFModel):
-        def __init__(self, lang: str = "ru", gpu: bool = False, dpi: int = 220):
-            import easyocr
+        def __init__(
+            self,
+            lang: str = "ru",
+            gpu: bool = False,
+            dpi: int = 220,
+            batch_size: Optional[int] = None,
+            pages_per_call: Optional[int] = None,
+        ):
             self.lang = lang
             self.dpi = dpi
-            self.reader = easyocr.Reader([lang], gpu=gpu)
+
+            # "craft" (default) or the lighter "dbnet18" text detector
+            self.detector = os.getenv("EASYOCR_DETECTOR") or "craft"
+
+            self.reader = _get_easyocr_reader(lang, gpu, self.detector)
+
+            # Text-line crops per recognizer batch: larger batches pay off on a
+            # GPU, on CPU they mostly cost memory
+            self.batch_size = batch_size or int(
+                os.getenv("RECOGNITION_BATCH_SIZE") or (32 if self.reader.device == "cuda" else 8)
+            )
+
+            # Pages per text-detector forward pass. Detector memory grows with
+            # every page in the pass (a 220 dpi page alone needs a few GB), so
+            # keep this small
+            self.pages_per_call = pages_per_call or int(
+                os.getenv("DETECTION_BATCH_SIZE") or (2 if self.reader.device == "cuda" else 1)
+            )
+
+        def _readtext_pages(self, pages: list[np.ndarray]) -> list[list[str]]:
+            if len(pages) == 1:
+                return [self.reader.readtext(pages[0], detail=0, batch_size=self.batch_size)]
+
+            # Only pages of one size are batched together, so no resize target
+            # is passed and every page keeps its aspect ratio
+            return self.reader.readtext_batched(pages, detail=0, batch_size=self.batch_size)
 
         def predict(self, pdf_bytes: bytes) -> str:
-            with tempfile.TemporaryDirectory() as td:
-                pages = pdf_bytes_to_page_images(pdf_bytes, Path(td), dpi=self.dpi)
-                out = []
-                for idx, page_path in enumerate(pages, start=1):
-                    results = self.reader.readtext(str(page_path), detail=0)
-                    text = "\n".join(results).strip()
-                    if text:
-                        out.append(f"## Page {idx}\n{text}")
-                return "\n\n".join(out).strip()
+            return self._predict_pages(iter_page_arrays(pdf_bytes, dpi=self.dpi))
+
+        def predict_path(self, pdf_path: str) -> str:
+            return self._predict_pages(iter_page_arrays(pdf_path, dpi=self.dpi))
+
+        def _predict_pages(self, pages: Iterable[np.ndarray]) -> str:
+            # EasyOCR takes 3-channel arrays as BGR (OpenCV order) when it
+            # converts them to grayscale for recognition; pages are RGB
+            pages = (np.ascontiguousarray(page[..., ::-1]) for page in pages)
 
-except ImportError:
-    pass
+            # Recognize one batch while the next pages are still being rendered
+            page_texts = []
+            for batch in _same_shape_batches(pages, self.pages_per_call):
+                page_texts.extend(self._readtext_pages(batch))
+
+            out = []
+            for idx, results in enumerate(page_texts, start=1):
+                text = "\n".join(results).strip()
+                if text:
+                    out.append(f"## Page {idx}\n{text}")
+            return "\n\n".join(out).strip()
 
 
 # =============================================================================
 # PyTesseract Model
 # =============================================================================
-try:
-    import pytesseract as _pytesseract_module
+if importlib.util.find_spec("pytesseract") is not None:
+
+    _tesserocr_available = importlib.util.find_spec("tesserocr") is not None
+
+    class _TesserocrPool:
+        """
+        Long-lived tesserocr APIs for one language.
+
+        Each API keeps its language data loaded, so pages are recognized
+        in-process without spawning tesseract. An API is not re-entrant,
+        so every thread borrows its own; new ones are created on demand
+        up to `size`.
+        """
+
+        def __init__(self, lang: str, size: int):
+            self.lang = lang
+            self.size = size
+            self._idle: queue.LifoQueue = queue.LifoQueue()
+            self._created = 0
+            self._lock = threading.Lock()
+
+        @contextmanager
+        def api(self):
+            try:
+                api = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    create = self._created < self.size
+                    if create:
+                        self._created += 1
+                if create:
+                    try:
+                        from tesserocr import PyTessBaseAPI
+                        api = PyTessBaseAPI(lang=self.lang)
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                else:
+                    api = self._idle.get()
+            try:
+                yield api
+            finally:
+                self._idle.put(api)
+
+    _tesserocr_pools: dict[str, _TesserocrPool] = {}
+    _tesserocr_pools_lock = threading.Lock()
+
+    def _get_tesserocr_pool(lang: str, size: int) -> _TesserocrPool:
+        """Share one API pool per language across model instances."""
+        with _tesserocr_pools_lock:
+            if lang not in _tesserocr_pools:
+                _tesserocr_pools[lang] = _TesserocrPool(lang, size)
+            return _tesserocr_pools[lang]
 
     @register_model("pytesseract", "PyTesseract")
     class PyTesseractModel(BasePDFModel):
@@ -99,57 +261,148 @@ try:
             else:
                 self.lang = "mkd"
 
-        def predict(self, pdf_bytes: bytes) -> str:
-            with tempfile.TemporaryDirectory() as td:
-                pages = pdf_bytes_to_page_images(pdf_bytes, Path(td), dpi=self.dpi)
-                out = []
-                for idx, page_path in enumerate(pages, start=1):
-                    img = self._Image.open(page_path)
-                    text = (self._tess.image_to_string(img, lang=self.lang) or "").strip()
-                    if text:
-                        out.append(f"## Page {idx}\n{text}")
-                return "\n\n".join(out).strip()
+            # Number of pages recognized at the same time (one tesseract process each).
+            # Set OMP_THREAD_LIMIT=1 in the environment (Dockerfile.pytesseract does)
+            # so the parallel pages do not fight over tesseract's OpenMP threads
+            self.concurrency = int(os.getenv("OCR_CONCURRENCY") or os.cpu_count() or 1)
+
+            # TESSERACT_BINARIZE=1 Otsu-binarizes pages to black-on-white before OCR
+            # and turns off tesseract's inverted-text pass, which is then redundant
+            # for the page as a whole. Opt-in: tesseract thresholds on its own, and
+            # that pass is what recovers white-on-dark blocks inside a normal page.
+            self.binarize = os.getenv("TESSERACT_BINARIZE", "0") == "1"
+            # Optional page segmentation mode, e.g. "6" for a single uniform block of text
+            self.psm = os.getenv("TESSERACT_PSM")
+
+            config = []
+            if self.psm:
+                config.append(f"--psm {self.psm}")
+            if self.binarize:
+                config.append("-c tessedit_do_invert=0")
+            self._config = " ".join(config)
+
+            # Prefer in-process tesserocr when installed, otherwise one tesseract subprocess per page
+            self._tesserocr = None
+            if _tesserocr_available:
+                self._tesserocr = _get_tesserocr_pool(self.lang, self.concurrency)
+
+        def warmup(self) -> None:
+            if self._tesserocr is not None:
+                # Borrowing an API creates it, which loads the language data
+                with self._tesserocr.api():
+                    return
+            # One tiny page: fails now if the binary or the language data is
+            # missing, and brings the traineddata file into the OS cache
+            self._tess.image_to_string(self._Image.new("L", (32, 32), 255), lang=self.lang)
+
+        def _binarized(self, page: np.ndarray):
+            """
+            Grayscale + Otsu threshold, giving a black-on-white L image.
+
+            The more common of the two classes is taken as the background, so
+            a page with light text on a dark background is inverted.
+            """
+            gray = self._Image.fromarray(page).convert("L")
+
+            # Otsu: pick the threshold that maximizes between-class variance
+            hist = np.asarray(gray.histogram(), dtype=np.float64)
+            levels = np.arange(256, dtype=np.float64)
+            w0 = np.cumsum(hist)
+            w1 = w0[-1] - w0
+            sum0 = np.cumsum(hist * levels)
+            mu0 = sum0 / np.maximum(w0, 1)
+            mu1 = (sum0[-1] - sum0) / np.maximum(w1, 1)
+            threshold = int(np.argmax(w0 * w1 * (mu0 - mu1) ** 2))
+
+            dark, light = [0] * (threshold + 1), [255] * (255 - threshold)
+            if w0[threshold] > w1[threshold]:
+                # Mostly dark pixels: dark background, light text
+                dark, light = [255] * (threshold + 1), [0] * (255 - threshold)
+            return gray.point(dark + light)
+
+        def _ocr_page(self, page: np.ndarray) -> str:
+            img = self._binarized(page) if self.binarize else self._Image.fromarray(page)
+
+            if self._tesserocr is not None:
+                with self._tesserocr.api() as api:
+                    if self.psm:
+                        api.SetPageSegMode(int(self.psm))
+                    if self.binarize:
+                        api.SetVariable("tessedit_do_invert", "0")
+                    api.SetImage(img)
+                    return (api.GetUTF8Text() or "").strip()
+
+            return (self._tess.image_to_string(img, lang=self.lang, config=self._config) or "").strip()
 
-except ImportError:
-    pass
+        def predict(self, pdf_bytes: bytes) -> str:
+            return self._predict_pages(iter_page_arrays(pdf_bytes, dpi=self.dpi))
+
+        def predict_path(self, pdf_path: str) -> str:
+            return self._predict_pages(iter_page_arrays(pdf_path, dpi=self.dpi))
+
+        def _predict_pages(self, pages: Iterable[np.ndarray]) -> str:
+            # tesseract runs outside the GIL (subprocess or tesserocr), so threads
+            # are enough to keep several pages in flight. Pages are submitted as
+            # they are rendered; a free slot is needed per page, so rendering
+            # never runs far ahead of OCR.
+            slots = threading.BoundedSemaphore(self.concurrency)
+            futures = []
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                for page in pages:
+                    slots.acquire()
+                    future = pool.submit(self._ocr_page, page)
+                    future.add_done_callback(lambda _: slots.release())
+                    futures.append(future)
+            texts = [future.result() for future in futures]
+
+            out = []
+            for idx, text in enumerate(texts, start=1):
+                if text:
+                    out.append(f"## Page {idx}\n{text}")
+            return "\n\n".join(out).strip()
 
 
 # =============================================================================
 # Marker Model
 # =============================================================================
-try:
-    from marker.converters.pdf import PdfConverter
-    from marker.models import create_model_dict
-    from marker.output import text_from_rendered
+if importlib.util.find_spec("marker") is not None:
 
     _marker_converter = None
+    # Held while the converter loads, so concurrent jobs and prewarm wait for
+    # it instead of loading every model a second time
+    _marker_converter_lock = threading.Lock()
 
     def _get_marker_converter():
         """Lazy initialization of Marker converter."""
         global _marker_converter
         if _marker_converter is None:
-            _marker_converter = PdfConverter(artifact_dict=create_model_dict())
+            with _marker_converter_lock:
+                if _marker_converter is None:
+                    from marker.converters.pdf import PdfConverter
+                    from marker.models import create_model_dict
+
+                    _marker_converter = PdfConverter(artifact_dict=create_model_dict())
         return _marker_converter
 
     @register_model("marker", "Marker")
     class MarkerModel(BasePDFModel):
 
         def __init__(self):
+            # Fails here, not at conversion time, if marker is broken, so
+            # safe_list_models() keeps hiding it
+            from marker.output import text_from_rendered
+
+            self._text_from_rendered = text_from_rendered
             self._converter = None
 
         def predict(self, pdf_bytes: bytes) -> str:
-            if self._converter is None:
-                self._converter = _get_marker_converter()
-
             tmp_path = None
             try:
-                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False, dir=scratch_dir(len(pdf_bytes))) as f:
                     tmp_path = f.name
                     f.write(pdf_bytes)
 
-                rendered = self._converter(tmp_path)
-                text, _, _ = text_from_rendered(rendered)
-                return (text or "").strip()
+                return self.predict_path(tmp_path)
 
             finally:
                 if tmp_path and os.path.exists(tmp_path):
@@ -158,7 +411,13 @@ try:
                     except Exception:
                         pass
 
-except ImportError:
-    pass
-except Exception:
-    pass
+        def warmup(self) -> None:
+            if self._converter is None:
+                self._converter = _get_marker_converter()
+
+        def predict_path(self, pdf_path: str) -> str:
+            self.warmup()
+
+            rendered = self._converter(pdf_path)
+            text, _, _ = self._text_from_rendered(rendered)
+            return (text or "").strip()
@@ -1,15 +1,200 @@
 from __future__ import annotations
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator
 import fitz
+import numpy as np
 
+# Below this many pages, starting render processes costs more than it saves
+PARALLEL_RENDER_MIN_PAGES = 8
+
+# PyMuPDF is not thread safe: every MuPDF call in this process (open, render,
+# close) happens under this lock. Parallel rendering uses processes instead.
+_mupdf_lock = threading.RLock()
+
+
+def pdf_bytes_to_page_images(
+    pdf_bytes: bytes,
+    out_dir: Path,
+    dpi: int = 220,
+    fmt: str = "png",
+    jpg_quality: int = 85,
+) -> list[Path]:
+    """
+    Render every page to an image file in out_dir.
+
+    Pages are lossless PNG by default. Models that accept lossy input can
+    pass fmt="jpg", which is far cheaper to encode than PNG's zlib
+    compression.
+    """
+    if fmt not in ("jpg", "png"):
+        raise ValueError(f"Unsupported page image format: {fmt}")
 
-def pdf_bytes_to_page_images(pdf_bytes: bytes, out_dir: Path, dpi: int = 220) -> list[Path]:
     out_dir.mkdir(parents=True, exist_ok=True)
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
     pages: list[Path] = []
-    for i, page in enumerate(doc):
-        pix = page.get_pixmap(dpi=dpi)
-        p = out_dir / f"page_{i + 1:03d}.png"
-        pix.save(str(p))
-        pages.append(p)
+    with _mupdf_lock:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        for i, page in enumerate(doc):
+            pix = page.get_pixmap(dpi=dpi, alpha=False)
+            p = out_dir / f"page_{i + 1:03d}.{fmt}"
+            if fmt == "jpg":
+                pix.save(str(p), jpg_quality=jpg_quality)
+            else:
+                pix.save(str(p))
+            pages.append(p)
+        doc.close()
     return pages
+
+
+def scratch_dir(size: int) -> str | None:
+    """
+    Directory for a temporary PDF of `size` bytes.
+
+    Returns /dev/shm (RAM-backed, so the PDF never hits the disk) when it
+    exists and has room to spare, otherwise None so tempfile falls back to
+    its default directory. Docker limits /dev/shm to 64 MB by default,
+    hence the free-space check.
+    """
+    shm = "/dev/shm"
+    try:
+        st = os.statvfs(shm)
+    except (OSError, AttributeError):
+        return None
+    if not os.access(shm, os.W_OK):
+        return None
+    # Keep headroom for concurrent uploads and other users of the tmpfs
+    return shm if st.f_bavail * st.f_frsize >= 2 * size else None
+
+
+def render_workers() -> int:
+    """Number of processes used to rasterize pages (PDF_RENDER_WORKERS, default: CPU count)."""
+    return int(os.getenv("PDF_RENDER_WORKERS") or os.cpu_count() or 1)
+
+
+def _page_to_array(page: fitz.Page, dpi: int) -> np.ndarray:
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+
+def _open_pdf(pdf: bytes | str | os.PathLike) -> fitz.Document:
+    with _mupdf_lock:
+        if isinstance(pdf, (bytes, bytearray)):
+            return fitz.open(stream=pdf, filetype="pdf")
+        # Opening by path lets MuPDF read the file directly instead of from a copy in memory
+        return fitz.open(pdf, filetype="pdf")
+
+
+def _close_pdf(doc: fitz.Document) -> None:
+    with _mupdf_lock:
+        doc.close()
+
+
+_worker_doc: fitz.Document | None = None
+
+_END_OF_PAGES = object()
+
+
+def _init_render_worker(pdf: bytes | str) -> None:
+    global _worker_doc
+    _worker_doc = _open_pdf(pdf)
+
+
+def _render_worker_page(index: int, dpi: int) -> np.ndarray:
+    return _page_to_array(_worker_doc[index], dpi)
+
+
+def _iter_rendered_in_thread(doc: fitz.Document, dpi: int, prefetch: int) -> Iterator[np.ndarray]:
+    """Render doc's pages on a background thread, holding at most `prefetch` ahead. Closes doc when done."""
+    rendered: queue.Queue = queue.Queue(maxsize=prefetch)
+    with _mupdf_lock:
+        page_count = doc.page_count
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for index in range(page_count):
+                if stop.is_set():
+                    break
+                # Other jobs render on their own threads; the lock is released
+                # before waiting for room in the queue
+                with _mupdf_lock:
+                    page = _page_to_array(doc[index], dpi)
+                rendered.put(page)
+        except Exception as e:
+            rendered.put(e)
+        finally:
+            rendered.put(_END_OF_PAGES)
+
+    threading.Thread(target=produce, daemon=True).start()
+    item = None
+    try:
+        while True:
+            item = rendered.get()
+            if item is _END_OF_PAGES:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # If the consumer stopped early, unblock the producer and let it finish
+        # before closing the document it is reading
+        stop.set()
+        while item is not _END_OF_PAGES:
+            item = rendered.get()
+        _close_pdf(doc)
+
+
+def iter_page_arrays(
+    pdf: bytes | str | os.PathLike,
+    dpi: int = 220,
+    prefetch: int | None = None,
+) -> Iterator[np.ndarray]:
+    """
+    Yield every page as an RGB uint8 array of shape (height, width, 3), in page order.
+
+    Pages are rendered in the background while the caller processes
+    earlier ones, so rendering overlaps with OCR. At most `prefetch`
+    pages (default: half the CPU count, at least 2) are held ahead of
+    the caller, which bounds memory for long documents.
+
+    Args:
+        pdf: Raw PDF bytes or a path to a PDF file.
+        dpi: Rendering resolution.
+        prefetch: Number of rendered pages allowed to wait for the caller.
+    """
+    prefetch = prefetch or max(2, (os.cpu_count() or 1) // 2)
+    doc = _open_pdf(pdf)
+    with _mupdf_lock:
+        page_count = doc.page_count
+    workers = min(render_workers(), page_count)
+
+    if workers < 2 or page_count < PARALLEL_RENDER_MIN_PAGES:
+        yield from _iter_rendered_in_thread(doc, dpi, prefetch)
+        return
+    _close_pdf(doc)
+
+    # Rendering in threads is serialized by _mupdf_lock, so pages are rendered
+    # in parallel in separate processes, each with its own copy of the
+    # document. "spawn" avoids forking a process that may already hold
+    # torch/OCR threads.
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_render_worker,
+        initargs=(pdf if isinstance(pdf, (bytes, bytearray)) else os.fspath(pdf),),
+    )
+    try:
+        in_flight: deque = deque()
+        next_index = 0
+        while next_index < page_count or in_flight:
+            while next_index < page_count and len(in_flight) < max(prefetch, workers):
+                in_flight.append(pool.submit(_render_worker_page, next_index, dpi))
+                next_index += 1
+            yield in_flight.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
@@ -1,3 +1,580 @@
-from django.test import TestCase
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from email.header import decode_header, make_header
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import fitz
+import numpy as np
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.apps import apps as django_apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from . import apps, jobs, ocr_models, ocr_registry, pdf_pages, views
+from .ocr_models import BasePDFModel
+from .pdf_pages import iter_page_arrays
+from .views import looks_like_pdf, normalize_markdown_spacing
+
+
+def make_pdf(page_count: int) -> bytes:
+    """A PDF whose page i is 100 + 10*i points wide, so rendered pages can be told apart."""
+    doc = fitz.open()
+    for i in range(page_count):
+        page = doc.new_page(width=100 + 10 * i, height=100)
+        page.insert_text((10, 50), f"Page {i + 1}")
+    return doc.tobytes()
+
+
+class NormalizeMarkdownSpacingTests(TestCase):
+    def test_line_endings(self):
+        self.assertEqual(normalize_markdown_spacing("a\r\nb\rc"), "a\nb\nc")
+
+    def test_nbsp_becomes_space(self):
+        self.assertEqual(normalize_markdown_spacing("a\u00a0b"), "a b")
+
+    def test_zero_width_removed(self):
+        self.assertEqual(normalize_markdown_spacing("a\u200bb\u200cc\u200dd\ufeffe"), "abcde")
+
+    def test_trailing_spaces_removed(self):
+        self.assertEqual(normalize_markdown_spacing("a \t \nb\u00a0\nc"), "a\nb\nc")
+
+    def test_blank_lines_collapsed(self):
+        self.assertEqual(normalize_markdown_spacing("a\n\n\n  \n\t\nb\r\n\r\nc"), "a\nb\nc")
+
+    def test_outer_whitespace_stripped(self):
+        self.assertEqual(normalize_markdown_spacing("\n\u00a0\u200b a\u00a0b \n\n"), "a b")
+
+    def test_inner_spaces_kept(self):
+        self.assertEqual(normalize_markdown_spacing("a   b\n  c"), "a   b\n  c")
+
+    def test_long_space_runs_are_linear(self):
+        # Linear scanning takes milliseconds here; a pattern that rescans the
+        # run from every position is quadratic and takes minutes. The bound is
+        # loose on purpose so slow machines do not fail it
+        text = "a" + " " * 300_000 + "b\n" + " \t" * 150_000 + "c"
+        start = time.monotonic()
+        self.assertEqual(normalize_markdown_spacing(text), text)
+        self.assertLess(time.monotonic() - start, 10)
+
+
+class LooksLikePdfTests(TestCase):
+    def upload(self, content: bytes) -> SimpleUploadedFile:
+        return SimpleUploadedFile("a.pdf", content, "application/pdf")
+
+    def test_pdf(self):
+        self.assertTrue(looks_like_pdf(self.upload(make_pdf(1))))
+
+    def test_leading_junk_is_accepted(self):
+        self.assertTrue(looks_like_pdf(self.upload(b"junk\n" + make_pdf(1))))
+
+    def test_not_a_pdf(self):
+        self.assertFalse(looks_like_pdf(self.upload(b"hello world" * 100)))
+
+    def test_signature_after_first_kilobyte(self):
+        self.assertFalse(looks_like_pdf(self.upload(b" " * 1024 + b"%PDF-1.7")))
+
+    def test_rewinds_upload(self):
+        uploaded = self.upload(make_pdf(1))
+        looks_like_pdf(uploaded)
+        self.assertEqual(uploaded.tell(), 0)
+
+    def test_convert_rejects_non_pdf(self):
+        uploaded = SimpleUploadedFile("a.pdf", b"hello world", "application/pdf")
+        response = self.client.post("/convert/", {"pdf": uploaded, "model_key": "pytesseract"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Not a valid PDF."})
+
+
+class IterPageArraysTests(TestCase):
+    def widths(self, pdf) -> list[int]:
+        return [page.shape[1] for page in iter_page_arrays(pdf, dpi=72)]
+
+    def test_pages_in_order(self):
+        pages = list(iter_page_arrays(make_pdf(3), dpi=72, prefetch=1))
+        self.assertEqual([p.shape for p in pages], [(100, 100, 3), (100, 110, 3), (100, 120, 3)])
+
+    def test_pages_in_order_with_render_processes(self):
+        count = pdf_pages.PARALLEL_RENDER_MIN_PAGES
+        with mock.patch.dict(os.environ, {"PDF_RENDER_WORKERS": "2"}):
+            self.assertEqual(self.widths(make_pdf(count)), [100 + 10 * i for i in range(count)])
+
+    def test_path_input(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "a.pdf")
+        with open(path, "wb") as f:
+            f.write(make_pdf(2))
+        self.assertEqual(self.widths(path), [100, 110])
+
+    def test_concurrent_documents(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(self.widths, [make_pdf(5) for _ in range(8)]))
+        self.assertEqual(results, [[100, 110, 120, 130, 140]] * 8)
+
+    def test_early_close_closes_document(self):
+        opened = []
+
+        def open_pdf(pdf):
+            doc = fitz.open(stream=pdf, filetype="pdf")
+            opened.append(doc)
+            return doc
+
+        with mock.patch.object(pdf_pages, "_open_pdf", open_pdf):
+            pages = iter_page_arrays(make_pdf(5), dpi=72, prefetch=1)
+            self.assertEqual(next(pages).shape[1], 100)
+            pages.close()
+        self.assertTrue(opened[0].is_closed)
+
+
+class PageCountModel(BasePDFModel):
+    calls = 0
+
+    def predict(self, pdf_bytes: bytes) -> str:
+        PageCountModel.calls += 1
+        pages = list(iter_page_arrays(pdf_bytes, dpi=10))
+        return "\r\n\r\n".join(f"Page {i}  " for i in range(1, len(pages) + 1))
+
+
+class ConvertFlowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        PageCountModel.calls = 0
+        # Built once: every save gets a new document id, so the bytes differ
+        self.pdf = make_pdf(2)
+        self.enterContext(mock.patch.dict(ocr_registry._REGISTRY, {"pages": PageCountModel}))
+
+    def convert(self, model_key: str = "pages"):
+        uploaded = SimpleUploadedFile("a.pdf", self.pdf, "application/pdf")
+        return self.client.post("/convert/", {"pdf": uploaded, "model_key": model_key})
+
+    def wait_for_job(self, job_id: str) -> dict:
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            response = self.client.get(f"/jobs/{job_id}/")
+            data = response.json()
+            if data.get("state") in ("done", "failed"):
+                return data
+            time.sleep(0.05)
+        self.fail("Job did not finish")
+
+    def test_convert_job_then_cached(self):
+        response = self.convert()
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+
+        data = self.wait_for_job(job_id)
+        self.assertEqual(data["state"], "done")
+        self.assertEqual(data["markdown"], "Page 1\nPage 2")
+        self.assertIn("Page 1", data["preview_html"])
+        # The job points at the cached result instead of holding a copy
+        self.assertEqual(set(jobs.status(job_id)), {"state", "result_key"})
+
+        response = self.convert()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["markdown"], "Page 1\nPage 2")
+        self.assertEqual(PageCountModel.calls, 1)
+
+    def test_unknown_model_rejected(self):
+        response = self.convert("nope")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Unknown model: nope"})
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get("/jobs/missing/").status_code, 404)
+
+    def test_busy_when_queue_is_full(self):
+        spooled = []
+        take_upload = views.take_upload
+
+        def tracked_take_upload(uploaded):
+            spooled.append(take_upload(uploaded))
+            return spooled[-1]
+
+        with mock.patch.object(jobs, "MAX_PENDING_JOBS", 0), \
+                mock.patch.object(views, "take_upload", tracked_take_upload):
+            response = self.convert()
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(os.path.exists(spooled[0]))
+
+
+class JobsTests(TestCase):
+    def test_queue_limit(self):
+        release = threading.Event()
+        with mock.patch.object(jobs, "MAX_PENDING_JOBS", 1):
+            job_id = jobs.submit(lambda: release.wait() and {})
+            with self.assertRaises(jobs.QueueFull):
+                jobs.submit(lambda: {})
+            release.set()
+            deadline = time.monotonic() + 10
+            while jobs._pending and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(jobs.status(job_id)["state"], "done")
+            # The finished job freed its slot
+            self.assertIsNotNone(jobs.status(jobs.submit(lambda: {})))
+
+
+class OrphanedUploadTests(TestCase):
+    def setUp(self):
+        self.tmp = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch.object(tempfile, "tempdir", self.tmp))
+
+    def spooled(self, pid: int, age: float = 0) -> str:
+        fd, path = tempfile.mkstemp(suffix=".pdf", prefix=f"{views.UPLOAD_SPOOL_PREFIX}{pid}-", dir=self.tmp)
+        os.close(fd)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_removes_uploads_of_dead_and_stale_processes(self):
+        dead = self.spooled(2 ** 22 + 1)
+        own = self.spooled(os.getpid())
+        live = self.spooled(os.getppid())
+        expired = self.spooled(os.getppid(), age=jobs.JOB_TTL + 1)
+        other = os.path.join(self.tmp, "unrelated.pdf")
+        open(other, "wb").close()
+
+        self.assertEqual(views.remove_orphaned_uploads(), 3)
+        self.assertEqual([os.path.exists(p) for p in (dead, own, live, expired, other)],
+                         [False, False, True, False, True])
+
+    def test_uploads_are_named_after_the_process(self):
+        path = views.spool_upload(SimpleUploadedFile("a.pdf", b"%PDF-1.7", "application/pdf"))
+        self.addCleanup(os.remove, path)
+        self.assertTrue(os.path.basename(path).startswith(f"{views.UPLOAD_SPOOL_PREFIX}{os.getpid()}-"))
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_multiprocess_server_detection(self):
+        cases = {
+            ("/venv/bin/gunicorn", "pdf2md_dnick.wsgi"): True,
+            ("uwsgi", "--ini", "app.ini"): True,
+            ("uvicorn", "pdf2md_dnick.asgi:application", "--workers", "4"): True,
+            ("uvicorn", "pdf2md_dnick.asgi:application"): False,
+            ("manage.py", "runserver"): False,
+        }
+        for argv, expected in cases.items():
+            with self.subTest(argv=argv), mock.patch.object(sys, "argv", list(argv)):
+                self.assertEqual(apps._is_multiprocess_server(), expected)
+
+    def test_process_local_cache_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            apps._check_shared_cache()
+
+    @override_settings(CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/a"},
+        "jobs": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/b"},
+    })
+    def test_shared_cache_accepted(self):
+        apps._check_shared_cache()
+
+
+@unittest.skipUnless("pytesseract" in ocr_registry._REGISTRY, "pytesseract is not installed")
+class TesseractBinarizeTests(TestCase):
+    def model(self, **env):
+        with mock.patch.dict(os.environ):
+            os.environ.pop("TESSERACT_BINARIZE", None)
+            os.environ.update(env)
+            return ocr_registry.create_model("pytesseract")
+
+    def page(self, background: int, text: int) -> np.ndarray:
+        page = np.full((100, 100, 3), background, dtype=np.uint8)
+        page[40:50, 10:90] = text
+        return page
+
+    def assert_black_on_white(self, img):
+        pixels = np.asarray(img)
+        self.assertEqual(img.mode, "L")
+        self.assertTrue((pixels[40:50, 10:90] == 0).all())
+        self.assertEqual(int((pixels == 0).sum()), 800)
+
+    def test_dark_text_on_light_background(self):
+        self.assert_black_on_white(self.model()._binarized(self.page(background=230, text=30)))
+
+    def test_light_text_on_dark_background_is_inverted(self):
+        self.assert_black_on_white(self.model()._binarized(self.page(background=30, text=230)))
+
+    def test_binarization_is_opt_in(self):
+        model = self.model()
+        self.assertFalse(model.binarize)
+        self.assertNotIn("tessedit_do_invert", model._config)
+
+    def test_inverted_text_pass_disabled_only_when_binarizing(self):
+        model = self.model(TESSERACT_BINARIZE="1")
+        self.assertTrue(model.binarize)
+        self.assertIn("-c tessedit_do_invert=0", model._config)
+
+
+class PrewarmTests(TestCase):
+    def test_is_serving(self):
+        cases = [
+            (["manage.py", "migrate"], {}, False),
+            (["/usr/bin/django-admin", "migrate"], {}, False),
+            (["/usr/lib/python3/django/__main__.py", "shell"], {}, False),
+            (["pytest"], {}, False),
+            (["manage.py", "runserver"], {}, False),
+            (["manage.py", "runserver"], {"RUN_MAIN": "true"}, True),
+            (["manage.py", "runserver", "--noreload"], {}, True),
+            (["/venv/bin/gunicorn", "pdf2md_dnick.wsgi"], {}, True),
+            (["uwsgi", "--ini", "app.ini"], {}, True),
+            ([], {}, False),
+        ]
+        for argv, env, expected in cases:
+            with self.subTest(argv=argv, env=env), \
+                    mock.patch.object(sys, "argv", argv), mock.patch.dict(os.environ, env):
+                if not env:
+                    os.environ.pop("RUN_MAIN", None)
+                self.assertEqual(apps._is_serving(), expected)
+
+    def ready(self, serving: bool) -> mock.Mock:
+        model = mock.Mock(spec=BasePDFModel)
+        with mock.patch.dict(ocr_registry._REGISTRY, {"warm": lambda: model}), \
+                mock.patch.dict(os.environ, {"PREWARM_MODEL": "warm"}), \
+                mock.patch.object(apps, "_is_serving", return_value=serving), \
+                mock.patch.object(apps, "_is_multiprocess_server", return_value=False), \
+                mock.patch.object(views, "remove_orphaned_uploads", return_value=0):
+            django_apps.get_app_config("pdf_converter").ready()
+        return model
+
+    def test_prewarms_when_serving(self):
+        self.ready(serving=True).warmup.assert_called_once_with()
+
+    def test_no_prewarm_otherwise(self):
+        self.ready(serving=False).warmup.assert_not_called()
+
+    @unittest.skipUnless("pytesseract" in ocr_registry._REGISTRY, "pytesseract is not installed")
+    def test_pytesseract_warmup_loads_language_data(self):
+        model = ocr_registry.create_model("pytesseract")
+        model._tesserocr = None
+        with mock.patch.object(model._tess, "image_to_string") as image_to_string:
+            model.warmup()
+        image_to_string.assert_called_once()
+        self.assertEqual(image_to_string.call_args.kwargs["lang"], model.lang)
+
+
+@unittest.skipUnless(hasattr(ocr_models, "_TesserocrPool"), "pytesseract is not installed")
+class TesserocrPoolTests(TestCase):
+    def setUp(self):
+        self.created = []
+        created = self.created
+
+        class FakeAPI:
+            def __init__(self, lang):
+                created.append(self)
+                self.lang = lang
+
+        fake = types.ModuleType("tesserocr")
+        fake.PyTessBaseAPI = FakeAPI
+        self.enterContext(mock.patch.dict(sys.modules, {"tesserocr": fake}))
+
+    def test_apis_are_reused(self):
+        pool = ocr_models._TesserocrPool("mkd", size=2)
+        for _ in range(3):
+            with pool.api() as api:
+                self.assertEqual(api.lang, "mkd")
+        self.assertEqual(len(self.created), 1)
+
+    def test_at_most_size_apis(self):
+        pool = ocr_models._TesserocrPool("mkd", size=2)
+        in_use = set()
+        lock = threading.Lock()
+        peak = 0
+
+        def borrow(_):
+            nonlocal peak
+            with pool.api() as api:
+                with lock:
+                    self.assertNotIn(id(api), in_use)
+                    in_use.add(id(api))
+                    peak = max(peak, len(in_use))
+                time.sleep(0.01)
+                with lock:
+                    in_use.discard(id(api))
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(borrow, range(30)))
+        self.assertEqual(len(self.created), 2)
+        self.assertEqual(peak, 2)
+
+    def test_failed_creation_frees_its_slot(self):
+        pool = ocr_models._TesserocrPool("mkd", size=1)
+        with mock.patch.object(sys.modules["tesserocr"], "PyTessBaseAPI", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                with pool.api():
+                    pass
+        with pool.api() as api:
+            self.assertEqual(api.lang, "mkd")
+
+    def test_one_pool_per_language(self):
+        with mock.patch.dict(ocr_models._tesserocr_pools, clear=True):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                pools = list(executor.map(lambda _: ocr_models._get_tesserocr_pool("rus", 2), range(16)))
+        self.assertEqual(len({id(pool) for pool in pools}), 1)
+
+
+class SameShapeBatchesTests(TestCase):
+    def shapes(self, pages, size):
+        return [[page.shape[:2] for page in batch] for batch in ocr_models._same_shape_batches(pages, size)]
+
+    def test_batches_up_to_size(self):
+        pages = [np.zeros((4, 3, 3), dtype=np.uint8)] * 5
+        self.assertEqual([len(b) for b in ocr_models._same_shape_batches(pages, 2)], [2, 2, 1])
+
+    def test_size_change_starts_new_batch(self):
+        portrait, landscape = np.zeros((4, 3, 3), dtype=np.uint8), np.zeros((3, 4, 3), dtype=np.uint8)
+        pages = [portrait, portrait, landscape, portrait, portrait]
+        self.assertEqual(self.shapes(pages, 4), [[(4, 3), (4, 3)], [(3, 4)], [(4, 3), (4, 3)]])
+
+    def test_consumes_lazily(self):
+        consumed = []
+
+        def pages():
+            for i in range(4):
+                consumed.append(i)
+                yield np.zeros((4, 3, 3), dtype=np.uint8)
+
+        batches = ocr_models._same_shape_batches(pages(), 2)
+        next(batches)
+        self.assertEqual(consumed, [0, 1, 2])
+
+    def test_empty(self):
+        self.assertEqual(list(ocr_models._same_shape_batches(iter([]), 2)), [])
+
+
+class OcrModelsApiTests(TestCase):
+    def setUp(self):
+        self.enterContext(mock.patch.object(views, "_ocr_models_body", None))
+        self.enterContext(mock.patch.object(views, "_ocr_models_expires", 0.0))
+        self.broken = True
+
+        def flaky():
+            if self.broken:
+                raise RuntimeError("backend not ready")
+            return PageCountModel()
+
+        self.enterContext(mock.patch.dict(ocr_registry._REGISTRY, {"flaky": flaky}, clear=True))
+
+    def keys(self):
+        response = self.client.get("/ocr-models/")
+        self.assertEqual(response["Content-Type"], "application/json")
+        return [m["key"] for m in response.json()["models"]]
+
+    def test_failure_is_retried(self):
+        self.assertEqual(self.keys(), [])
+        self.broken = False
+        # Still within the retry interval
+        self.assertEqual(self.keys(), [])
+        with mock.patch.object(views, "_ocr_models_expires", 0.0):
+            self.assertEqual(self.keys(), ["flaky"])
+
+    def test_complete_list_is_kept(self):
+        self.broken = False
+        self.assertEqual(self.keys(), ["flaky"])
+        with mock.patch.object(views, "safe_list_models") as safe_list_models:
+            self.assertEqual(self.keys(), ["flaky"])
+        safe_list_models.assert_not_called()
+
+
+class PdfBytesToPageImagesTests(TestCase):
+    def test_png_by_default(self):
+        out_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        paths = pdf_pages.pdf_bytes_to_page_images(make_pdf(2), out_dir, dpi=72)
+        self.assertEqual([p.name for p in paths], ["page_001.png", "page_002.png"])
+        self.assertTrue(paths[0].read_bytes().startswith(b"\x89PNG"))
+
+    def test_jpg_on_request(self):
+        out_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        paths = pdf_pages.pdf_bytes_to_page_images(make_pdf(1), out_dir, dpi=72, fmt="jpg")
+        self.assertTrue(paths[0].read_bytes().startswith(b"\xff\xd8"))
+
+
+class DownloadTextTests(TestCase):
+    def download(self, text: str, filename: str = "output"):
+        return self.client.post("/download/", {"text": text, "filename": filename})
+
+    def test_body_and_length(self):
+        text = "Здраво свет\n" * 1000
+        response = self.download(text)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertEqual(response.content, text.encode("utf-8"))
+        self.assertEqual(response["Content-Length"], str(len(text.encode("utf-8"))))
+
+    def test_empty(self):
+        response = self.download("")
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["Content-Length"], "0")
+
+    def test_filename_sanitized(self):
+        cases = {
+            "report": "report.txt",
+            "my report_v1.2-final.txt": "my report_v1.2-final.txt",
+            '../../etc/"passwd"; x=y': "....etcpasswd xy.txt",
+            "Извештај: 1/2": "Извештај 12.txt",
+        }
+        for filename, expected in cases.items():
+            with self.subTest(filename=filename):
+                response = self.download("x", filename)
+                # Django MIME-encodes non-ASCII header values
+                disposition = str(make_header(decode_header(response.headers["Content-Disposition"])))
+                self.assertEqual(disposition, f'attachment; filename="{expected}"')
+
+
+class PreviewCacheTests(TestCase):
+    def setUp(self):
+        views.markdown_cache_clear()
+        self.addCleanup(views.markdown_cache_clear)
+
+    def cached_texts(self, *texts):
+        return [views._preview_cache.get(self.key(t)) is not None for t in texts]
+
+    def key(self, text):
+        return views.hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def test_hit_returns_same_html(self):
+        html = views.render_preview_html("# Title")
+        self.assertIn("Title", html)
+        self.assertIs(views.render_preview_html("# Title"), html)
+
+    def test_least_recently_used_evicted_by_count(self):
+        with mock.patch.object(views, "PREVIEW_CACHE_SIZE", 2):
+            views.render_preview_html("a")
+            views.render_preview_html("b")
+            views.render_preview_html("a")
+            views.render_preview_html("c")
+        self.assertEqual(self.cached_texts("a", "b", "c"), [True, False, True])
+
+    def test_evicted_by_total_size(self):
+        big = "x" * 1000
+        limit = 2 * sys.getsizeof(views._markdown_to_html(big + "1")) + 100
+        with mock.patch.object(views, "PREVIEW_CACHE_MAX_BYTES", limit):
+            for suffix in "123":
+                views.render_preview_html(big + suffix)
+            self.assertEqual(self.cached_texts(big + "1", big + "2", big + "3"), [False, True, True])
+            self.assertLessEqual(views._preview_cache_bytes, limit)
+
+    def test_oversized_preview_not_cached(self):
+        with mock.patch.object(views, "PREVIEW_CACHE_MAX_BYTES", 100):
+            views.render_preview_html("y" * 1000)
+        self.assertEqual(len(views._preview_cache), 0)
+        self.assertEqual(views._preview_cache_bytes, 0)
+
+    def test_clear_resets_size(self):
+        views.render_preview_html("a")
+        views.markdown_cache_clear()
+        self.assertEqual((len(views._preview_cache), views._preview_cache_bytes), (0, 0))
+
+    def test_conversion_results_not_cached_twice(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "a.pdf")
+        with open(path, "wb") as f:
+            f.write(make_pdf(1))
+        with mock.patch.dict(ocr_registry._REGISTRY, {"pages": PageCountModel}):
+            result = views.convert_file(path, "pages", "pdf2md:test:pages")
+        self.addCleanup(cache.delete, "pdf2md:test:pages")
+        self.assertEqual(cache.get("pdf2md:test:pages"), result)
+        self.assertEqual(len(views._preview_cache), 0)
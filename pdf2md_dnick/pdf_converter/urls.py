@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path("", views.home, name="home"),
     path("convert/", views.convert_pdf, name="convert_pdf"),
+    path("jobs/<str:job_id>/", views.job_status, name="job_status"),
     path("render/", views.render_markdown, name="render_markdown"),
     path("download/", views.download_text, name="download_text"),
     path("ocr-models/", views.ocr_models_api, name="ocr_models_api"),
@@ -1,12 +1,86 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.move import file_move_safe
 from django.http import JsonResponse, HttpResponse
 from django.shortcuts import render
+from django.views.decorators.gzip import gzip_page
 from django.views.decorators.http import require_http_methods
 from django.middleware.csrf import get_token
+import hashlib
+import os
 import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 import markdown as md
 
-from . import ocr_models
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import cmarkgfm
+    from cmarkgfm.cmark import Options as CmarkOptions
+except ImportError:
+    cmarkgfm = None
+
+try:
+    from pytesseract import TesseractNotFoundError
+except ImportError:
+    class TesseractNotFoundError(Exception):
+        """Stand-in so the except clause below works without pytesseract."""
+
+from . import jobs, ocr_models
 from .ocr_registry import list_models, create_model, safe_list_models
+from .pdf_pages import scratch_dir
+
+# Uploads are copied to disk in chunks of this size instead of being read whole
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Spooled uploads are named <prefix><pid>-<random>.pdf, so files left behind by
+# a process that died can be found and removed (see remove_orphaned_uploads)
+UPLOAD_SPOOL_PREFIX = "pdf2md-upload-"
+
+# python-markdown extensions, used when cmarkgfm is not installed.
+# No "toc": the preview never shows a table of contents, and it costs an extra pass over every heading
+PREVIEW_EXTENSIONS = ["fenced_code", "tables", "nl2br"]
+
+# Number of rendered previews kept, keyed by a digest of the markdown text,
+# and the most memory they may use together (a single preview can be several MB)
+PREVIEW_CACHE_SIZE = 256
+PREVIEW_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+_md_local = threading.local()
+
+_preview_cache: OrderedDict[bytes, str] = OrderedDict()
+_preview_cache_bytes = 0
+_preview_cache_lock = threading.Lock()
+
+_SPACING_TRANSLATION = str.maketrans({
+    "\r": "\n",
+    "\u00A0": " ",
+    "\u200B": None,
+    "\u200C": None,
+    "\u200D": None,
+    "\uFEFF": None,
+})
+# Anchored to the start of a space/tab run: unanchored, every position inside
+# a long run of spaces not followed by a newline rescans the rest of the run,
+# which is quadratic in the run length
+_LINE_BREAKS_RE = re.compile(r"(?<![ \t])[ \t]*\n(?:[ \t]*\n)*")
+
+# Characters dropped from download filenames: anything but letters, digits, "_", ".", "-" and space
+_UNSAFE_FILENAME_RE = re.compile(r"[^\w.\- ]")
+
+# Serialized ocr_models_api response and when to rebuild it (time.monotonic())
+_ocr_models_body = None
+_ocr_models_expires = 0.0
+
+# When some model failed to load, the list is rebuilt after this many seconds
+OCR_MODELS_RETRY_SECONDS = 60
 
 
 def home(request):
@@ -14,45 +88,69 @@ def home(request):
     return render(request, "pdf_converter/home.html")
 
 
+@gzip_page
 @require_http_methods(["POST"])
 def convert_pdf(request):
     uploaded = request.FILES.get("pdf")
     model_key = (request.POST.get("model_key") or "").strip()
 
     if not uploaded:
-        return JsonResponse({"error": "No PDF uploaded."}, status=400)
+        return json_response({"error": "No PDF uploaded."}, status=400)
     if not uploaded.name.lower().endswith(".pdf"):
-        return JsonResponse({"error": "File must be a PDF."}, status=400)
+        return json_response({"error": "File must be a PDF."}, status=400)
+    if not looks_like_pdf(uploaded):
+        return json_response({"error": "Not a valid PDF."}, status=400)
     if not model_key:
-        return JsonResponse({"error": "Please select a model."}, status=400)
+        return json_response({"error": "Please select a model."}, status=400)
+    if model_key not in {m.key for m in list_models()}:
+        return json_response({"error": f"Unknown model: {model_key}"}, status=400)
+
+    # The same PDF converted with the same model gives the same result, so
+    # re-uploads (e.g. while comparing models) skip OCR entirely
+    cache_key = f"pdf2md:{pdf_digest(uploaded)}:{model_key}"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return json_response(cached)
 
-    pdf_bytes = uploaded.read()
+    # OCR runs in the background; the client polls job_status with this id.
+    # The job only records where convert_file cached the result, so the
+    # markdown is not stored twice
+    pdf_path = take_upload(uploaded)
+
+    def run():
+        convert_file(pdf_path, model_key, cache_key)
+        return {"result_key": cache_key}
 
     try:
-        model = create_model(model_key)
-        text = model.predict(pdf_bytes)
-        text = normalize_markdown_spacing(text)
-    except Exception as e:
-        if 'tesseract' in str(e):
-            return JsonResponse({"error": "PyTesseract is not installed.\nType this into the terminal:\nbrew install tesseract-lang"}, status=500)
-        else:
-            return JsonResponse({"error": f"Conversion failed: {str(e)}"}, status=500)
+        job_id = jobs.submit(run)
+    except jobs.QueueFull:
+        os.remove(pdf_path)
+        return json_response({"error": "The server is busy, please try again in a few minutes."}, status=503)
+    return json_response({"job_id": job_id}, status=202)
 
-    preview_html = md.markdown(text, extensions=["fenced_code", "tables", "toc", "nl2br"])
 
-    return JsonResponse({"markdown": text, "preview_html": preview_html})
+@gzip_page
+@require_http_methods(["GET"])
+def job_status(request, job_id):
+    job = jobs.status(job_id)
+    if job is None:
+        return json_response({"error": "Unknown or expired job."}, status=404)
+    if job["state"] == "done":
+        result = cache.get(job["result_key"])
+        if result is None:
+            return json_response({"error": "The result has expired, please convert again."}, status=404)
+        return json_response({"state": "done", **result})
+    return json_response(job)
 
 
+@gzip_page
 @require_http_methods(["POST"])
 def render_markdown(request):
     text = request.POST.get("text", "")
     text = normalize_markdown_spacing(text)
 
-    preview_html = md.markdown(
-        text,
-        extensions=["fenced_code", "tables", "toc", "nl2br"]
-    )
-    return JsonResponse({"preview_html": preview_html})
+    preview_html = render_preview_html(text)
+    return json_response({"preview_html": preview_html})
 
 
 @require_http_methods(["POST"])
@@ -62,20 +160,236 @@ def download_text(request):
     if not filename.endswith(".txt"):
         filename += ".txt"
 
-    response = HttpResponse(text, content_type="text/plain; charset=utf-8")
-    safe_name = "".join(c for c in filename if c.isalnum() or c in ("-", "_", ".", " "))
+    body = text.encode("utf-8")
+    response = HttpResponse(body, content_type="text/plain; charset=utf-8")
+    response["Content-Length"] = str(len(body))
+    safe_name = _UNSAFE_FILENAME_RE.sub("", filename)
     response["Content-Disposition"] = f'attachment; filename="{safe_name}"'
     return response
 
 
 def ocr_models_api(request):
-    models = [{"key": m.key, "label": m.label} for m in safe_list_models()]
-    return JsonResponse({"models": models})
+    # safe_list_models() instantiates every model to find the usable ones, so
+    # the body is kept. Once every registered model loaded, the answer cannot
+    # change until the process restarts; if some failed, possibly transiently,
+    # the list is rebuilt after OCR_MODELS_RETRY_SECONDS.
+    global _ocr_models_body, _ocr_models_expires
+    now = time.monotonic()
+    if _ocr_models_body is None or now >= _ocr_models_expires:
+        available = safe_list_models()
+        models = [{"key": m.key, "label": m.label} for m in available]
+        _ocr_models_body = json_response({"models": models}).content
+        complete = len(available) == len(list_models())
+        _ocr_models_expires = float("inf") if complete else now + OCR_MODELS_RETRY_SECONDS
+    return HttpResponse(_ocr_models_body, content_type="application/json")
+
+
+def json_response(data: dict, status: int = 200) -> HttpResponse:
+    """JsonResponse equivalent that serializes with orjson when it is installed."""
+    if orjson is None:
+        return JsonResponse(data, status=status)
+    return HttpResponse(orjson.dumps(data), status=status, content_type="application/json")
+
+
+def _markdown_renderer() -> md.Markdown:
+    # Building a Markdown instance loads every extension; keep one per thread
+    # since an instance holds parser state while converting
+    renderer = getattr(_md_local, "renderer", None)
+    if renderer is None:
+        renderer = _md_local.renderer = md.Markdown(extensions=PREVIEW_EXTENSIONS)
+    return renderer
+
+
+def _markdown_to_html(text: str) -> str:
+    if cmarkgfm is not None:
+        # GFM covers fenced code and tables; HARDBREAKS does what nl2br does
+        return cmarkgfm.github_flavored_markdown_to_html(text, options=CmarkOptions.CMARK_OPT_HARDBREAKS)
+    return _markdown_renderer().reset().convert(text)
+
+
+def render_preview_html(text: str, remember: bool = True) -> str:
+    """
+    Render markdown to preview HTML; repeated previews of the same text are served from cache.
+
+    Pass remember=False when the caller keeps the HTML itself (e.g. in the
+    conversion result cache), so it is not held twice.
+    """
+    global _preview_cache_bytes
+    # Key by a fixed-size digest so the cache does not also keep every source text alive
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    with _preview_cache_lock:
+        html = _preview_cache.get(key)
+        if html is not None:
+            _preview_cache.move_to_end(key)
+            return html
+
+    html = _markdown_to_html(text)
+    size = sys.getsizeof(html)
+    if not remember or size > PREVIEW_CACHE_MAX_BYTES:
+        return html
+
+    with _preview_cache_lock:
+        if key not in _preview_cache:
+            _preview_cache[key] = html
+            _preview_cache_bytes += size
+        _preview_cache.move_to_end(key)
+        while len(_preview_cache) > PREVIEW_CACHE_SIZE or _preview_cache_bytes > PREVIEW_CACHE_MAX_BYTES:
+            _, evicted = _preview_cache.popitem(last=False)
+            _preview_cache_bytes -= sys.getsizeof(evicted)
+    return html
+
+
+def markdown_cache_clear() -> None:
+    """Drop all cached preview HTML."""
+    global _preview_cache_bytes
+    with _preview_cache_lock:
+        _preview_cache.clear()
+        _preview_cache_bytes = 0
+
+
+def looks_like_pdf(uploaded) -> bool:
+    """Check the %PDF- signature, which readers accept anywhere in the first 1 KB, without reading the rest."""
+    uploaded.seek(0)
+    head = uploaded.read(1024)
+    uploaded.seek(0)
+    return b"%PDF-" in head
+
+
+def pdf_digest(uploaded) -> str:
+    """SHA-256 of an uploaded file."""
+    if not hasattr(hashlib, "file_digest"):  # Python < 3.11
+        digest = hashlib.sha256()
+        for chunk in uploaded.chunks(chunk_size=UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    # file_digest hashes in-memory uploads straight from their buffer and
+    # reads on-disk ones into a reused buffer, without a Python-level loop
+    uploaded.file.seek(0)
+    digest = hashlib.file_digest(uploaded.file, "sha256")
+    uploaded.file.seek(0)
+    return digest.hexdigest()
+
+
+class ConversionError(Exception):
+    """A conversion failed; the message is shown to the user."""
+
+
+def convert_file(pdf_path: str, model_key: str, cache_key: str) -> dict:
+    """
+    Convert a PDF that this call owns (it is deleted afterwards) and cache the result.
+
+    Raises:
+        ConversionError: With a message suitable for showing to the user.
+    """
+    try:
+        model = create_model(model_key)
+        text = model.predict_path(pdf_path)
+        text = normalize_markdown_spacing(text)
+    except TesseractNotFoundError as e:
+        raise ConversionError("PyTesseract is not installed.\nType this into the terminal:\nbrew install tesseract-lang") from e
+    except Exception as e:
+        raise ConversionError(f"Conversion failed: {str(e)}") from e
+    finally:
+        # Normally still there; remove_orphaned_uploads() may have taken it
+        # if the job waited longer than its state is kept
+        try:
+            os.remove(pdf_path)
+        except FileNotFoundError:
+            pass
+
+    # The result cache below keeps the HTML; no need for the preview cache too
+    preview_html = render_preview_html(text, remember=False)
+
+    result = {"markdown": text, "preview_html": preview_html}
+    cache.set(cache_key, result, timeout=settings.PDF_RESULT_CACHE_TIMEOUT)
+    return result
+
+
+def take_upload(uploaded) -> str:
+    """
+    Return the path of a temporary .pdf holding the upload, owned by the caller.
+
+    The file must outlive the request, because the conversion runs in the
+    background. Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are already on disk
+    (TemporaryUploadedFile) and are moved rather than copied; Django tolerates
+    its temporary file being gone at the end of the request.
+    """
+    if hasattr(uploaded, "temporary_file_path"):
+        fd, pdf_path = tempfile.mkstemp(suffix=".pdf", prefix=_spool_prefix())
+        os.close(fd)
+        file_move_safe(uploaded.temporary_file_path(), pdf_path, allow_overwrite=True)
+        return pdf_path
+    return spool_upload(uploaded)
+
+
+def spool_upload(uploaded) -> str:
+    """Copy an uploaded PDF to a temporary file chunk by chunk and return its path."""
+    with tempfile.NamedTemporaryFile(
+        suffix=".pdf", prefix=_spool_prefix(), delete=False, dir=scratch_dir(uploaded.size)
+    ) as tmp:
+        for chunk in uploaded.chunks(chunk_size=UPLOAD_CHUNK_SIZE):
+            tmp.write(chunk)
+    return tmp.name
+
+
+def _spool_prefix() -> str:
+    return f"{UPLOAD_SPOOL_PREFIX}{os.getpid()}-"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_orphaned_uploads() -> int:
+    """
+    Delete spooled uploads whose jobs can no longer run, and return how many.
+
+    Uploads are spooled before their job starts, so a process that dies
+    (crash, OOM kill, restart) leaves its queued uploads behind in /dev/shm
+    or the temp directory. Called at start-up, before this process spools
+    anything: files named after this process's pid are left over from an
+    earlier process with the same pid. Files of other live processes are
+    kept, unless they are older than jobs.JOB_TTL, when nobody can fetch
+    their result anymore.
+    """
+    removed = 0
+    now = time.time()
+    for directory in {tempfile.gettempdir(), "/dev/shm"}:
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            if not name.startswith(UPLOAD_SPOOL_PREFIX):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                pid = int(name[len(UPLOAD_SPOOL_PREFIX):].split("-", 1)[0])
+                live = pid != os.getpid() and _process_alive(pid)
+                if live and now - os.path.getmtime(path) < jobs.JOB_TTL:
+                    continue
+                os.remove(path)
+                removed += 1
+            except (ValueError, OSError):
+                continue
+    return removed
+
 
 def normalize_markdown_spacing(s: str) -> str:
-    s = s.replace("\r\n", "\n").replace("\r", "\n")
-    s = s.replace("\u00A0", " ")
-    s = re.sub(r"[\u200B-\u200D\uFEFF]", "", s)
-    s = re.sub(r"[ \t]+\n", "\n", s)
-    s = re.sub(r"\n{2,}", "\n", s)
-    return s.strip()
\ No newline at end of file
+    # CR -> LF, NBSP -> space and zero-width removal in one pass; a CRLF becomes
+    # two newlines, which the collapse below folds back into one
+    s = s.translate(_SPACING_TRANSLATION)
+    if "\n" not in s:
+        return s.strip()
+    # Trailing spaces/tabs and blank lines in one pass: any run of
+    # whitespace-only line endings becomes a single newline
+    s = _LINE_BREAKS_RE.sub("\n", s)
+    return s.strip()